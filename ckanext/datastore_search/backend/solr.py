@@ -1,10 +1,16 @@
 import pysolr
-import json
+import orjson
+import hashlib
 import requests
 import re
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
 from logging import getLogger
 
-from typing import Any, Optional, Dict, cast, List
+from typing import Any, Optional, Dict, Iterator, Tuple, Union, cast, List
 from ckan.types import Context, DataDict
 
 from ckan.plugins.toolkit import _, config, get_action, enqueue_job
@@ -20,20 +26,94 @@ from ckanext.datastore_search.backend import (
 
 
 MAX_ERR_LEN = 1000
+INDEX_BATCH_SIZE = 1000
+SCHEMA_CACHE_TTL = 300
+SCHEMA_CACHE_SIZE = 1000
+JSON_HEADERS = {'Content-Type': 'application/json'}
 PSQL_TO_SOLR_WILCARD_MATCH = re.compile('^_?|_?$')
+SOLR_SPECIAL_CHARS = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/\s])')
 
 log = getLogger(__name__)
 DEBUG = config.get('debug', False)
+SOLR_TIMEOUT = config.get('solr_timeout')
+
+FIELD_TYPE_MAP = {
+    # numeric types
+    'smallint': 'int',
+    'integer': 'int',
+    'bigint': 'int',
+    'decimal': 'float',
+    'numeric': 'float',
+    'real': 'double',
+    'double precision': 'double',
+    'smallserial': 'int',
+    'serial': 'int',
+    'bigserial': 'int',
+    # monetary types
+    'money': 'float',
+    # char types
+    'character varying': 'text',
+    'varchar': 'text',
+    'character': 'text',
+    'char': 'text',
+    'bpchar': 'text',
+    'text': 'text',
+    # binary types
+    'bytea': 'binary',
+    # datetime types
+    'timestamp': 'date',
+    'date': 'date',
+    'time': 'date',
+    'interval': 'date',
+    # bool types
+    'boolean': 'boolean',
+    # TODO: map geometric types
+    # TODO: map object/array types
+}
+
+
+def solr_escape(value: Any) -> str:
+    """
+    Escapes Lucene query syntax characters in a value.
+    """
+    return SOLR_SPECIAL_CHARS.sub(r'\\\1', str(value))
+
+
+def solr_wildcard_terms(value: Any) -> str:
+    """
+    Converts a DataStore filter value into ANDed SOLR wildcard terms.
+
+    NOTE: wildcard terms are not tokenized by SOLR, so the value is
+          split on whitespace to match the tokens of text fields.
+    """
+    terms = [re.sub(PSQL_TO_SOLR_WILCARD_MATCH, '*', solr_escape(token))
+             for token in str(value).replace(':*', '').split()]
+    if not terms:
+        return '*'
+    return '(%s)' % ' AND '.join(terms)
 
 
 class DatastoreSolrBackend(DatastoreSearchBackend):
     """
     SOLR class for datastore search backend.
     """
-    timeout = config.get('solr_timeout')
     default_search_fields = ['_id', '_version_', 'indexed_ts', '_text_']
+    _default_search_field_set = frozenset(default_search_fields)
     configset_name = config.get('ckanext.datastore_search.solr.configset',
                                 'datastore_resource')
+    pool_size = int(config.get('ckanext.datastore_search.solr.pool_size', 10))
+    max_concurrency = int(config.get(
+        'ckanext.datastore_search.solr.max_concurrency', 4))
+
+    def __init__(self):
+        self._http = requests.Session()
+        if self.url:
+            adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                  pool_maxsize=self.pool_size)
+            self._http.mount(self.url, adapter)
+        self._schema_fingerprints: 'OrderedDict[str, Tuple[float, bytes]]' = \
+            OrderedDict()
+        self._heavy_sem = threading.BoundedSemaphore(self.max_concurrency)
 
     @property
     def field_type_map(self):
@@ -45,56 +125,151 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
               This is mainly to support the extending of DataStore
               types. e.g. through TableDesigner interfaces.
         """
-        return {
-            # numeric types
-            'smallint': 'int',
-            'integer': 'int',
-            'bigint': 'int',
-            'decimal': 'float',
-            'numeric': 'float',
-            'real': 'double',
-            'double precision': 'double',
-            'smallserial': 'int',
-            'serial': 'int',
-            'bigserial': 'int',
-            # monetary types
-            'money': 'float',
-            # char types
-            'character varying': 'text',
-            'varchar': 'text',
-            'character': 'text',
-            'char': 'text',
-            'bpchar': 'text',
-            'text': 'text',
-            # binary types
-            'bytea': 'binary',
-            # datetime types
-            'timestamp': 'date',
-            'date': 'date',
-            'time': 'date',
-            'interval': 'date',
-            # bool types
-            'boolean': 'boolean',
-            # TODO: map geometric types
-            # TODO: map object/array types
-        }
+        return FIELD_TYPE_MAP
+
+    def _core_name(self, resource_id: Optional[str]) -> str:
+        """
+        Returns the SOLR core name for a DataStore Resource.
+        """
+        return f'{self.prefix}{resource_id}'
 
     def _make_connection(self,
                          resource_id: Optional[str] = None) -> Optional[pysolr.Solr]:
         """
-        Tries to make a SOLR connection to a core.
+        Returns a SOLR connection to a core on the shared HTTP session.
+
+        NOTE: the core is not pinged here, a missing core will
+              surface as a 404 on the first real request.
         """
         if not resource_id:
             return
-        core_name = f'{self.prefix}{resource_id}'
-        conn_string = f'{self.url}/solr/{core_name}'
+        return pysolr.Solr(
+            f'{self.url}/solr/{self._core_name(resource_id)}',
+            timeout=SOLR_TIMEOUT,
+            always_commit=False,
+            session=self._http)
+
+    def _get_core(self,
+                  resource_id: Optional[str] = None,
+                  connection: Optional[pysolr.Solr] = None) \
+            -> Tuple[str, Optional[pysolr.Solr]]:
+        """
+        Returns the SOLR core name and the given or a new connection
+        for a DataStore Resource.
+        """
+        return (self._core_name(resource_id),
+                connection if connection else self._make_connection(resource_id))
+
+    def _is_missing_core(self, error: Union[pysolr.SolrError, str]) -> bool:
+        """
+        Whether a SOLR error was caused by the core not existing.
+        """
+        return '(HTTP 404)' in str(error)
+
+    def _forget_core(self, core_name: str):
+        """
+        Drops the cached schema fingerprint of a SOLR core.
+        """
+        self._schema_fingerprints.pop(core_name, None)
+
+    def _create_core(self, resource_id: Optional[str]):
+        """
+        Enqueues the creation of a SOLR core on the SOLR server.
+        """
+        core_name = self._core_name(resource_id)
+        callback_queue = add_queue_name_prefix(self.redis_callback_queue_name)
+        enqueue_job(
+            # type_ignore_reason: incomplete typing
+            fn='solr_utils.create_solr_core.proc.create_solr_core',  # type: ignore
+            kwargs={
+                'core_name': core_name,
+                'config_set': self.configset_name,
+                'callback_fn': 'ckanext.datastore_search.logic.'
+                               'action.datastore_search_create_callback',
+                'callback_queue': callback_queue,
+                'callback_timeout': config.get('ckan.jobs.timeout', 300)},
+            title='SOLR Core creation %s' % core_name,
+            queue=self.redis_queue_name,
+            rq_kwargs={'timeout': 60})
+        log.debug('Enqueued SOLR Core creation for DataStore Resource %s ',
+                  resource_id)
+
+    def _send_json_request(self,
+                           conn_string: str,
+                           method: str,
+                           body: Optional[Dict[str, Any]] = None,
+                           check_status: bool = False) -> Dict[str, Any]:
+        """
+        Sends a JSON request through the pooled session, encoding the body
+        and parsing the raw response bytes with orjson.
+
+        NOTE: errors are raised as pysolr.SolrError, in the same
+              format as pysolr, so callers can handle both alike.
+        """
+        try:
+            if method == 'POST':
+                resp = self._http.post(
+                    conn_string,
+                    headers=JSON_HEADERS,
+                    timeout=SOLR_TIMEOUT,
+                    data=orjson.dumps(body) if body else None)
+            else:
+                resp = self._http.get(conn_string,
+                                      timeout=SOLR_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            raise pysolr.SolrError(
+                'Failed to connect to server at %s: %s' % (conn_string, e))
+        if check_status and resp.status_code != 200:
+            raise pysolr.SolrError(
+                'Solr responded with an error (HTTP %s): %s' %
+                (resp.status_code, resp.text[:MAX_ERR_LEN]))
         try:
-            conn = pysolr.Solr(conn_string, timeout=self.timeout)
-            resp = json.loads(conn.ping())
-            if resp.get('status') == 'OK':
-                return conn
-        except pysolr.SolrError:
-            pass
+            return orjson.loads(resp.content)
+        except orjson.JSONDecodeError:
+            raise pysolr.SolrError(
+                'Solr responded with an error (HTTP %s): %s' %
+                (resp.status_code, resp.text[:MAX_ERR_LEN]))
+
+    def _send_core_request(self,
+                           core_name: str,
+                           method: str,
+                           path: str,
+                           body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Sends a JSON request to a SOLR core.
+        """
+        return self._send_json_request(f'{self.url}/solr/{core_name}/{path}',
+                                       method, body, check_status=True)
+
+    def _get_solr_fields(self, core_name: str) -> Dict[str, Any]:
+        """
+        Returns the SOLR schema fields of a core keyed by name, excluding
+        the default search fields.
+        """
+        solr_fields = self._send_core_request(
+            core_name, 'GET', 'schema/fields')['fields']
+        keyed_solr_fields = {}
+        for solr_field in solr_fields:
+            if solr_field['name'] in self._default_search_field_set:
+                continue
+            keyed_solr_fields[solr_field['name']] = solr_field
+        return keyed_solr_fields
+
+    @contextmanager
+    def _heavy_operation(self,
+                         operation: str,
+                         resource_id: Optional[str] = None) -> Iterator[None]:
+        """
+        Limits the number of concurrent heavy SOLR operations
+        (schema changes and batch indexing) from this process.
+        """
+        with self._heavy_sem:
+            start = time.monotonic()
+            try:
+                yield
+            finally:
+                log.debug('SOLR %s for DataStore Resource %s took %.3f seconds',
+                          operation, resource_id, time.monotonic() - start)
 
     def _send_api_request(self,
                           method: str,
@@ -105,17 +280,8 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
 
         NOTE: pysolr does not have an API v2 interface.
         """
-        conn_string = f'{self.url}/api/{endpoint}'
-        if method == 'POST':
-            resp = requests.post(
-                conn_string,
-                headers={'Content-Type': 'application/json'},
-                timeout=self.timeout,
-                data=json.dumps(body) if body else None)
-        else:
-            resp = requests.get(conn_string,
-                                timeout=self.timeout)
-        return resp.json()
+        return self._send_json_request(f'{self.url}/api/{endpoint}',
+                                       method, body)
 
     def _get_site_context(self) -> Context:
         """
@@ -124,33 +290,84 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         site_user = get_action('get_site_user')({'ignore_auth': True}, {})
         return cast(Context, {'user': site_user['name']})
 
+    def _index_records(self,
+                       conn: pysolr.Solr,
+                       records: List[Dict[str, Any]],
+                       resource_id: Optional[str] = None) -> List[str]:
+        """
+        Adds records to the SOLR index in batches of INDEX_BATCH_SIZE.
+
+        Returns the SOLR error messages of any failed batches.
+        """
+        errors = []
+        for i in range(0, len(records), INDEX_BATCH_SIZE):
+            batch = records[i:i + INDEX_BATCH_SIZE]
+            try:
+                with self._heavy_operation('add', resource_id):
+                    conn.add(docs=batch, commit=False)
+                if DEBUG:
+                    log.debug('Indexed %s DataStore records for Resource %s',
+                              len(batch), resource_id)
+            except pysolr.SolrError as e:
+                errors.append(e.args[0])
+        return errors
+
+    def _unindex_records(self,
+                         conn: pysolr.Solr,
+                         record_ids: List[str],
+                         resource_id: Optional[str] = None) -> List[str]:
+        """
+        Removes records from the SOLR index by their _id (the uniqueKey)
+        in batches of INDEX_BATCH_SIZE.
+
+        Returns the SOLR error messages of any failed batches.
+        """
+        errors = []
+        for i in range(0, len(record_ids), INDEX_BATCH_SIZE):
+            batch = record_ids[i:i + INDEX_BATCH_SIZE]
+            try:
+                conn.delete(id=batch, commit=False)
+                if DEBUG:
+                    log.debug('Unindexed %s DataStore records for Resource %s',
+                              len(batch), resource_id)
+            except pysolr.SolrError as e:
+                errors.append(e.args[0])
+        return errors
+
     def reindex(self,
                 resource_id: Optional[str] = None,
                 connection: Optional[pysolr.Solr] = None,
-                only_missing: bool = False) -> Any:
+                only_missing: bool = False,
+                reload_core: bool = True) -> Any:
         """
         Reindexes the SOLR core.
+
+        NOTE: the Schema API already reloads the core after a schema
+              change, so callers can skip the extra reload.
         """
         if not resource_id:
             return
         # FIXME: put this in a background task as a larger
         #        DS Resource could take a long time??
         context = self._get_site_context()
-        core_name = f'{self.prefix}{resource_id}'
-        conn = self._make_connection(resource_id) if not connection else connection
+        core_name, conn = self._get_core(resource_id, connection)
 
         if not conn:
             raise DatastoreSearchException(
                 _('SOLR core does not exist for DataStore Resource %s') % resource_id)
 
-        errmsg = _('Could not reload SOLR core %s') % core_name
-        resp = self._send_api_request(method='POST',
-                                      endpoint=f'cores/{core_name}/reload')
-        if 'error' in resp:
-            raise DatastoreSearchException(
-                errmsg if not DEBUG
-                else resp['error'].get('msg', errmsg)[:MAX_ERR_LEN])
-        log.debug('Reloaded SOLR Core for DataStore Resource %s' % resource_id)
+        if reload_core:
+            try:
+                resp = self._send_api_request(method='POST',
+                                              endpoint=f'cores/{core_name}/reload')
+            except pysolr.SolrError as e:
+                resp = {'error': {'msg': e.args[0]}}
+            if 'error' in resp:
+                errmsg = _('Could not reload SOLR core %s') % core_name
+                raise DatastoreSearchException(
+                    errmsg if not DEBUG
+                    else resp['error'].get('msg', errmsg)[:MAX_ERR_LEN])
+            log.debug('Reloaded SOLR Core for DataStore Resource %s', resource_id)
 
         ds_result = get_action('datastore_search')(
             context, {'resource_id': resource_id, 'limit': 0,
@@ -159,7 +376,7 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         ds_total = ds_result['total']
         ds_field_ids = []
         for ds_field in ds_result.get('fields', []):
-            if ds_field['id'] not in self.default_search_fields:
+            if ds_field['id'] not in self._default_search_field_set:
                 ds_field_ids.append(ds_field['id'])
         ds_columns = '_id,' + ','.join([identifier(c) for c in ds_field_ids])
 
@@ -187,9 +404,8 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         where_statement = 'WHERE _id NOT IN ({indexed_ids})'.format(
             indexed_ids=','.join(indexed_ids)) if \
             only_missing and indexed_ids and int(solr_total) <= int(ds_total) else ''
-        core_name = f'{self.prefix}{resource_id}'
-        errmsg = _('Failed to reindex records for %s' % core_name)
         existing_ids = []
+        indexed_id_set = set(indexed_ids)
         while gathering_ds_records:
             sql_string = '''
                 SELECT {columns} FROM {table} {where_statement}
@@ -202,31 +418,29 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
                 context, {'sql': sql_string})
             if not ds_result['records']:
                 gathering_ds_records = False
+            records = []
             for r in ds_result['records']:
                 existing_ids.append(str(r['_id']))
-                if only_missing and indexed_ids and str(r['_id']) in indexed_ids:
+                if only_missing and str(r['_id']) in indexed_id_set:
                     continue
-                try:
-                    conn.add(docs=[r], commit=False)
-                    if DEBUG:
-                        log.debug('Indexed DataStore record _id=%s for Resource %s' %
-                                  (r['_id'], resource_id))
-                except pysolr.SolrError as e:
-                    raise DatastoreSearchException(
-                        errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-            offset += 1000
-        orphan_ids = set(indexed_ids) - set(existing_ids)
-        for orphan_id in orphan_ids:
-            try:
-                conn.delete(q='_id:%s' % orphan_id, commit=False)
-                if DEBUG:
-                    log.debug('Unindexed DataStore record _id=%s for Resource %s' %
-                              (orphan_id, resource_id))
-            except pysolr.SolrError as e:
+                records.append(r)
+            errors = self._index_records(conn, records, resource_id)
+            if errors:
+                errmsg = _('Failed to reindex records for %s') % core_name
                 raise DatastoreSearchException(
-                    errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-        conn.commit(waitSearcher=False)
-        log.debug('Reindexed SOLR Core for DataStore Resource %s' % resource_id)
+                    errmsg if not DEBUG else '\n'.join(errors)[:MAX_ERR_LEN])
+            offset += 1000
+        orphan_ids = indexed_id_set.difference(existing_ids)
+        errors = self._unindex_records(conn, list(orphan_ids), resource_id)
+        try:
+            conn.commit(softCommit=True, waitSearcher=False)
+        except pysolr.SolrError as e:
+            errors.append(e.args[0])
+        if errors:
+            errmsg = _('Failed to reindex records for %s') % core_name
+            raise DatastoreSearchException(
+                errmsg if not DEBUG else '\n'.join(errors)[:MAX_ERR_LEN])
+        log.debug('Reindexed SOLR Core for DataStore Resource %s', resource_id)
 
     def _check_counts(self,
                       resource_id: Optional[str] = None,
@@ -237,7 +451,7 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         if not resource_id:
             return
 
-        conn = self._make_connection(resource_id) if not connection else connection
+        core_name, conn = self._get_core(resource_id, connection)
 
         if not conn:
             raise DatastoreSearchException(
@@ -249,141 +463,140 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
                                        'include_total': True,
                                        'skip_search_engine': True})
         ds_total = ds_result['total']
-        solr_result = conn.search(q='*:*', rows=0)
+        try:
+            solr_result = conn.search(q='*:*', rows=0)
+        except pysolr.SolrError as e:
+            if self._is_missing_core(e):
+                # the records are indexed by the core creation callback
+                self._forget_core(core_name)
+                self._create_core(resource_id)
+                return
+            errmsg = _('Failed to count records for resource %s') % resource_id
+            raise DatastoreSearchException(
+                errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
         solr_total = solr_result.hits
 
         if int(ds_total) != int(solr_total):
             log.debug('SOLR (count: %s) and Postgres (count: %s) out of sync, '
-                      'reindexing SOLR for DataStore Resource %s' %
-                      (solr_total, ds_total, resource_id))
-            self.reindex(resource_id, connection=conn, only_missing=True)
-
-    def create(self,
-               data_dict: DataDict,
-               connection: Optional[pysolr.Solr] = None) -> Any:
+                      'reindexing SOLR for DataStore Resource %s',
+                      solr_total, ds_total, resource_id)
+            self.reindex(resource_id, connection=conn, only_missing=True,
+                         reload_core=False)
+
+    def _sync_schema(self,
+                     resource_id: Optional[str],
+                     core_name: str,
+                     conn: pysolr.Solr,
+                     fields: List[Dict[str, Any]]) -> bool:
         """
-        Create or update & reload/reindex a core if the fields have changed.
-        """
-        resource_id = data_dict.get('resource_id')
-        core_name = f'{self.prefix}{resource_id}'
-        conn = self._make_connection(resource_id) if not connection else connection
-        if not conn:
-            errmsg = _('Could not create SOLR core %s') % core_name
-            callback_queue = add_queue_name_prefix(self.redis_callback_queue_name)
-            enqueue_job(
-                # type_ignore_reason: incomplete typing
-                fn='solr_utils.create_solr_core.proc.create_solr_core',  # type: ignore
-                kwargs={
-                    'core_name': core_name,
-                    'config_set': self.configset_name,
-                    'callback_fn': 'ckanext.datastore_search.logic.'
-                                   'action.datastore_search_create_callback',
-                    'callback_queue': callback_queue,
-                    'callback_timeout': config.get('ckan.jobs.timeout', 300)},
-                title='SOLR Core creation %s' % core_name,
-                queue=self.redis_queue_name,
-                rq_kwargs={'timeout': 60})
-            log.debug('Enqueued SOLR Core creation for DataStore Resource %s ' %
-                      resource_id)
-            return
-        if not conn:
-            raise DatastoreSearchException(
-                _('Could not connect to SOLR core %s') % core_name)
+        Adds, modifies and removes SOLR fields to match the DataStore fields,
+        reindexing the core if anything changed.
 
+        Returns False if the core does not exist and its creation was enqueued.
+        """
         try:
-            solr_fields = json.loads(conn._send_request(
-                method='GET', path='schema/fields'))['fields']
+            keyed_solr_fields = self._get_solr_fields(core_name)
         except pysolr.SolrError as e:
+            if self._is_missing_core(e):
+                self._create_core(resource_id)
+                return False
             errmsg = _('Could not get SOLR fields from core %s') % core_name
             raise DatastoreSearchException(
                 errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-        keyed_solr_fields = {}
-        for solr_field in solr_fields:
-            if solr_field['name'] in self.default_search_fields:
-                continue
-            keyed_solr_fields[solr_field['name']] = solr_field
-        ds_field_ids = []
+        field_type_map = self.field_type_map
+        ds_field_ids = set()
         new_fields = []
         updated_fields = []
-        remove_fields = []
-        for ds_field in data_dict.get('fields', []):
-            if ds_field['id'] not in self.default_search_fields:
-                ds_field_ids.append(ds_field['id'])
+        for ds_field in fields:
+            if ds_field['id'] not in self._default_search_field_set:
+                ds_field_ids.add(ds_field['id'])
+            solr_type = field_type_map[ds_field['type']]
             if ds_field['id'] not in keyed_solr_fields:
                 new_fields.append({
                     'name': ds_field['id'],
-                    'type': self.field_type_map[ds_field['type']],
+                    'type': solr_type,
                     'stored': True,
                     'indexed': True})
                 continue
-            if self.field_type_map[ds_field['type']] == \
-               keyed_solr_fields[ds_field['id']]['type']:
+            if solr_type == keyed_solr_fields[ds_field['id']]['type']:
                 continue
             updated_fields.append(dict(keyed_solr_fields[ds_field['id']],
-                                       type=self.field_type_map[ds_field['type']]))
-        for field_name in [i for i in keyed_solr_fields.keys()
-                           if i not in ds_field_ids]:
-            remove_fields.append({'name': field_name})
-
-        for f in new_fields:
-            errmsg = _('Could not add field %s to SOLR Schema %s' %
-                       (f['name'], core_name))
-            try:
-                resp = json.loads(conn._send_request(
-                    method='POST', path='schema',
-                    body=json.dumps({'add-field': f}),
-                    headers={'Content-Type': 'application/json'}))
-            except pysolr.SolrError as e:
-                raise DatastoreSearchException(
-                    errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-            if 'error' in resp:
-                raise DatastoreSearchException(
-                    errmsg if not DEBUG
-                    else resp['error'].get('msg', errmsg)[:MAX_ERR_LEN])
-            log.debug('Added SOLR Field %s for DataStore Resource %s' %
-                      (f['name'], resource_id))
-
-        for f in updated_fields:
-            errmsg = _('Could not update field %s on SOLR Schema %s' %
-                       (f['name'], core_name))
+                                       type=solr_type))
+        remove_fields = [{'name': field_name} for field_name in
+                         keyed_solr_fields.keys() - ds_field_ids]
+
+        schema_changes = {}
+        if new_fields:
+            schema_changes['add-field'] = new_fields
+        if updated_fields:
+            schema_changes['replace-field'] = updated_fields
+        if remove_fields:
+            schema_changes['delete-field'] = remove_fields
+
+        if schema_changes:
+            error = None
             try:
-                resp = json.loads(conn._send_request(
-                    method='POST', path='schema',
-                    body=json.dumps({'replace-field': f}),
-                    headers={'Content-Type': 'application/json'}))
+                with self._heavy_operation('schema update', resource_id):
+                    resp = self._send_core_request(
+                        core_name, 'POST', 'schema', schema_changes)
             except pysolr.SolrError as e:
+                error = e.args[0]
+            else:
+                if 'error' in resp:
+                    error = resp['error'].get('msg', '')
+                elif 'errors' in resp:
+                    error = orjson.dumps(resp['errors']).decode()
+            if error is not None:
+                errmsg = _('Could not update SOLR Schema %s') % core_name
                 raise DatastoreSearchException(
-                    errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-            if 'error' in resp:
-                raise DatastoreSearchException(
-                    errmsg if not DEBUG
-                    else resp['error'].get('msg', errmsg)[:MAX_ERR_LEN])
-            log.debug('Modified SOLR Field %s for DataStore Resource %s' %
-                      (f['name'], resource_id))
+                    errmsg if not DEBUG else (error or errmsg)[:MAX_ERR_LEN])
+            for f in new_fields:
+                log.debug('Added SOLR Field %s for DataStore Resource %s',
+                          f['name'], resource_id)
+            for f in updated_fields:
+                log.debug('Modified SOLR Field %s for DataStore Resource %s',
+                          f['name'], resource_id)
+            for f in remove_fields:
+                log.debug('Removed SOLR Field %s for DataStore Resource %s',
+                          f['name'], resource_id)
+            self.reindex(resource_id, connection=conn, reload_core=False)
+
+        return True
 
-        for f in remove_fields:
-            errmsg = _('Could not delete field %s from SOLR Schema %s' %
-                       (f['name'], core_name))
-            try:
-                resp = json.loads(conn._send_request(
-                    method='POST', path='schema',
-                    body=json.dumps({'delete-field': f}),
-                    headers={'Content-Type': 'application/json'}))
-            except pysolr.SolrError as e:
-                raise DatastoreSearchException(
-                    errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-            if 'error' in resp:
-                raise DatastoreSearchException(
-                    errmsg if not DEBUG
-                    else resp['error'].get('msg', errmsg)[:MAX_ERR_LEN])
-            log.debug('Removed SOLR Field %s for DataStore Resource %s' %
-                      (f['name'], resource_id))
+    def create(self,
+               data_dict: DataDict,
+               connection: Optional[pysolr.Solr] = None) -> Any:
+        """
+        Create or update & reload/reindex a core if the fields have changed.
+        """
+        resource_id = data_dict.get('resource_id')
+        core_name, conn = self._get_core(resource_id, connection)
+        if not conn:
+            raise DatastoreSearchException(
+                _('Could not connect to SOLR core %s') % core_name)
 
-        if new_fields or updated_fields or remove_fields:
-            self.reindex(resource_id, connection=conn)
+        fields = data_dict.get('fields', [])
+        fingerprint = hashlib.blake2b(
+            orjson.dumps(sorted((f['id'], f['type']) for f in fields)),
+            digest_size=16).digest()
+        # other workers may change the schema or drop the core, so a
+        # cached fingerprint is only trusted for SCHEMA_CACHE_TTL seconds
+        cached = self._schema_fingerprints.get(core_name)
+        if not cached or cached[1] != fingerprint or \
+                time.monotonic() - cached[0] > SCHEMA_CACHE_TTL:
+            if not self._sync_schema(resource_id, core_name, conn, fields):
+                self._forget_core(core_name)
+                return
+            self._schema_fingerprints[core_name] = (time.monotonic(), fingerprint)
+            self._schema_fingerprints.move_to_end(core_name)
+            while len(self._schema_fingerprints) > SCHEMA_CACHE_SIZE:
+                self._schema_fingerprints.popitem(last=False)
 
         if 'records' in data_dict:
             self.upsert(data_dict, connection=conn)
+            if core_name not in self._schema_fingerprints:
+                # upsert found the core missing and enqueued its creation
+                return
 
         self._check_counts(resource_id, connection=conn)
 
@@ -393,11 +606,11 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         after successful creation of the SOLR core.
         """
         if data_dict.get('exit_code'):
-            log.debug('SOLR core creation exit_code: %s' % data_dict.get('exit_code'))
+            log.debug('SOLR core creation exit_code: %s', data_dict.get('exit_code'))
         if data_dict.get('stdout'):
-            log.debug('SOLR core creation stdout: %s' % data_dict.get('stdout'))
+            log.debug('SOLR core creation stdout: %s', data_dict.get('stdout'))
         if data_dict.get('stderr'):
-            log.debug('SOLR core creation stderr: %s' % data_dict.get('stderr'))
+            log.debug('SOLR core creation stderr: %s', data_dict.get('stderr'))
 
         resource_id = data_dict.get('core_name', '').replace(self.prefix, '')
 
@@ -418,25 +631,27 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         Insert records into the SOLR index.
         """
         resource_id = data_dict.get('resource_id')
-        core_name = f'{self.prefix}{resource_id}'
-        conn = self._make_connection(resource_id) if not connection else connection
+        core_name, conn = self._get_core(resource_id, connection)
 
         if not conn:
             raise DatastoreSearchException(
                 _('SOLR core does not exist for DataStore Resource %s') % resource_id)
 
         if data_dict['records']:
-            for r in data_dict['records']:
-                try:
-                    conn.add(docs=[r], commit=False)
-                    if DEBUG:
-                        log.debug('Indexed DataStore record _id=%s for Resource %s' %
-                                  (r['_id'], resource_id))
-                except pysolr.SolrError as e:
-                    errmsg = _('Failed to index records for %s' % core_name)
-                    raise DatastoreSearchException(
-                        errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-            conn.commit(waitSearcher=False)
+            errors = self._index_records(conn, data_dict['records'], resource_id)
+            if errors and all(self._is_missing_core(err) for err in errors):
+                # the records are indexed by the core creation callback
+                self._forget_core(core_name)
+                self._create_core(resource_id)
+                return
+            try:
+                conn.commit(softCommit=True, waitSearcher=False)
+            except pysolr.SolrError as e:
+                errors.append(e.args[0])
+            if errors:
+                errmsg = _('Failed to index records for %s') % core_name
+                raise DatastoreSearchException(
+                    errmsg if not DEBUG else '\n'.join(errors)[:MAX_ERR_LEN])
 
         self._check_counts(resource_id, connection=conn)
 
@@ -451,7 +666,7 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
             return
 
         resource_id = data_dict.get('resource_id')
-        conn = self._make_connection(resource_id) if not connection else connection
+        core_name, conn = self._get_core(resource_id, connection)
 
         if not conn:
             raise DatastoreSearchException(
@@ -466,9 +681,7 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         #       see:  https://search.open.canada.ca/page/help/?opendata
 
         for key, value in filters.items():
-            fq.append('%s:%s' % (key, re.sub(PSQL_TO_SOLR_WILCARD_MATCH,
-                                             '*',
-                                             value.replace(':*', ''))))
+            fq.append('%s:%s' % (key, solr_wildcard_terms(value)))
         if query and isinstance(query, str):
             # FIXME: solve the query of all _text_ field
             q = '*%s*' % re.sub(PSQL_TO_SOLR_WILCARD_MATCH,
@@ -476,9 +689,7 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
                                 query.replace(':*', ''))
         elif query and isinstance(query, dict):
             for key, value in query.items():
-                fq.append('%s:%s' % (key, re.sub(PSQL_TO_SOLR_WILCARD_MATCH,
-                                                 '*',
-                                                 value.replace(':*', ''))))
+                fq.append('%s:%s' % (key, solr_wildcard_terms(value)))
 
         solr_query = {
             'q': q,
@@ -493,7 +704,11 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         try:
             results = conn.search(**solr_query)
         except pysolr.SolrError as e:
-            errmsg = _('Failed to query records for resource %s' % resource_id)
+            if self._is_missing_core(e):
+                errmsg = _('SOLR core does not exist for DataStore Resource %s') % \
+                    resource_id
+            else:
+                errmsg = _('Failed to query records for resource %s') % resource_id
             raise DatastoreSearchException(
                 errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
 
@@ -506,44 +721,51 @@ class DatastoreSolrBackend(DatastoreSearchBackend):
         Removes records from the SOLR index, or deletes the core entirely.
         """
         resource_id = data_dict.get('resource_id')
-        core_name = f'{self.prefix}{resource_id}'
-        conn = self._make_connection(resource_id) if not connection else connection
+        core_name, conn = self._get_core(resource_id, connection)
 
         if not conn:
             raise DatastoreSearchException(
                 _('SOLR core does not exist for DataStore Resource %s') % resource_id)
 
         if not data_dict.get('filters'):
-            errmsg = _('Could not delete SOLR core %s') % core_name
             try:
                 conn.delete(q='*:*', commit=False)
-                log.debug('Unindexed all DataStore records for Resource %s' %
+                if data_dict.get('filters') is not None:
+                    conn.commit(softCommit=True, waitSearcher=False)
+                log.debug('Unindexed all DataStore records for Resource %s',
                           resource_id)
             except pysolr.SolrError as e:
+                errmsg = _('Could not delete SOLR core %s') % core_name
                 raise DatastoreSearchException(
                     errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-            conn.commit(waitSearcher=False)
             if data_dict.get('filters') is None:
-                resp = self._send_api_request(
-                    method='POST', endpoint=f'cores/{core_name}/unload')
+                try:
+                    # hard commit so the deletes are on disk before the unload
+                    conn.commit(waitSearcher=False)
+                    resp = self._send_api_request(
+                        method='POST', endpoint=f'cores/{core_name}/unload')
+                except pysolr.SolrError as e:
+                    resp = {'error': {'msg': e.args[0]}}
                 if 'error' in resp:
+                    errmsg = _('Could not delete SOLR core %s') % core_name
                     raise DatastoreSearchException(
                         errmsg if not DEBUG
                         else resp['error'].get('msg', errmsg)[:MAX_ERR_LEN])
-                log.debug('Unloaded SOLR Core for DataStore Resource %s' % resource_id)
+                self._forget_core(core_name)
+                log.debug('Unloaded SOLR Core for DataStore Resource %s', resource_id)
             return
 
-        for record in data_dict.get('deleted_records', []):
-            errmsg = _('Could not delete DataStore record _id=%s in SOLR core %s') % \
-                       (record['_id'], core_name)
+        deleted_ids = [str(r['_id']) for r in data_dict.get('deleted_records', [])]
+        errors = self._unindex_records(conn, deleted_ids, resource_id)
+        if deleted_ids:
             try:
-                conn.delete(q='_id:%s' % record['_id'], commit=False)
-                if DEBUG:
-                    log.debug('Unindexed DataStore record _id=%s for Resource %s' %
-                              (record['_id'], resource_id))
+                conn.commit(softCommit=True, waitSearcher=False)
             except pysolr.SolrError as e:
-                raise DatastoreSearchException(
-                    errmsg if not DEBUG else e.args[0][:MAX_ERR_LEN])
-            conn.commit(waitSearcher=False)
+                errors.append(e.args[0])
+        if errors:
+            errmsg = _('Could not delete DataStore records in SOLR core %s') % \
+                core_name
+            raise DatastoreSearchException(
+                errmsg if not DEBUG else '\n'.join(errors)[:MAX_ERR_LEN])
 
         self._check_counts(resource_id, connection=conn)